@@ -3,8 +3,13 @@
 #
 
 import datetime
+import gzip
+import hashlib
+import json
 import os
-import xml.dom.minidom as xml
+import threading
+import xml.etree.ElementTree as etree
+import xml.sax.saxutils as saxutils
 
 try:
     import configparser
@@ -32,14 +37,69 @@ def today():
     d = '%2d%s' % (now.day, s)
     return '%s %s %s' % (d, m, y)
 
+#
+# Bump when the model changes so cached models are not used.
+#
+model_version = 1
+
+_configurations = {}
+_configurations_lock = threading.Lock()
+
+def config_hash(config):
+    h = hashlib.sha256()
+    h.update(str(model_version).encode())
+    with open(config, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+class xml_writer:
+    '''Write an XML document to a file as it is created. The layout is the same
+    as a minidom document's pretty XML.'''
+    def __init__(self, out, indent = ' ' * 2, newl = os.linesep):
+        self.out = out
+        self.indent = indent
+        self.newl = newl
+        self.depth = 0
+        self.out.write('<?xml version="1.0" ?>' + self.newl)
+
+    def start(self, tag, attrs = []):
+        attrs = ''.join([' %s=%s' % (n, saxutils.quoteattr(v, { '"': '&quot;' }))
+                         for n, v in attrs])
+        self.out.write('%s<%s%s>%s' % (self.indent * self.depth, tag, attrs, self.newl))
+        self.depth += 1
+
+    def end(self, tag):
+        self.depth -= 1
+        self.out.write('%s</%s>%s' % (self.indent * self.depth, tag, self.newl))
+
+    def element(self, tag, text):
+        self.out.write('%s<%s>%s</%s>%s' % (self.indent * self.depth,
+                                            tag, saxutils.escape(text),
+                                            tag, self.newl))
+
+def get(ctx, config, cache = None):
+    '''Get the configuration for the INI file. A configuration is created once
+    for each version of the INI file and shared by the build and its rules. If
+    cache is a directory the model is cached on disk keyed by the hash of the
+    INI file.'''
+    digest = config_hash(config)
+    key = (os.path.abspath(config), digest)
+    with _configurations_lock:
+        if key not in _configurations:
+            _configurations[key] = configuration(ctx, config, cache, digest)
+        return _configurations[key]
+
 class configuration:
-    def __init__(self, ctx, config):
+    def __init__(self, ctx, config, cache = None, digest = None):
         self.ctx = ctx
         self.config = None
         self.branches = None
         self.releases = None
+        self.release_index = None
         self.titles = None
         self.name = None
+        self.cache = cache
+        self.digest = digest
         self.load(config)
 
     def __str__(self):
@@ -83,50 +143,64 @@ class configuration:
         else:
             return items
 
-    def _xml_create_doc(self, cat, name, legacy, release, html, pdf):
-        doc = cat.createElement('doc')
-
-        name_ = cat.createElement('name')
-        text = cat.createTextNode(name)
-        name_.appendChild(text)
-        doc.appendChild(name_)
-
-        title_ = cat.createElement('title')
-        text = cat.createTextNode(self.titles[name.lower()])
-        title_.appendChild(text)
-        doc.appendChild(title_)
-
+    def _xml_doc(self, writer, name, legacy, release, html, pdf):
+        writer.start('doc')
+        writer.element('name', name)
+        writer.element('title', self.titles[name.lower()])
         if legacy:
-            legacy_ = cat.createElement('legacy')
-            text = cat.createTextNode('Yes')
-            legacy_.appendChild(text)
-            doc.appendChild(legacy_)
-
-        release_ = cat.createElement('release')
-        text = cat.createTextNode(release)
-        release_.appendChild(text)
-        doc.appendChild(release_)
-
-        version_ = cat.createElement('version')
-        text = cat.createTextNode(release)
-        version_.appendChild(text)
-        doc.appendChild(version_)
-
-        html_ = cat.createElement('html')
-        text = cat.createTextNode(html)
-        html_.appendChild(text)
-        doc.appendChild(html_)
-
-        pdf_ = cat.createElement('pdf')
-        text = cat.createTextNode(pdf)
-        pdf_.appendChild(text)
-        doc.appendChild(pdf_)
-
-        return doc
+            writer.element('legacy', 'Yes')
+        writer.element('release', release)
+        writer.element('version', release)
+        writer.element('html', html)
+        writer.element('pdf', pdf)
+        writer.end('doc')
+
+    def _cache_name(self):
+        return os.path.join(self.cache, 'configuration.json')
+
+    def _load_cache(self):
+        if self.cache is None or not os.path.exists(self._cache_name()):
+            return False
+        try:
+            with open(self._cache_name(), 'r') as f:
+                model = json.load(f)
+        except ValueError:
+            return False
+        if model.get('digest') != self.digest:
+            return False
+        self.titles = model['titles']
+        self.latestes = model['latest']
+        self.branches = model['branches']
+        self.releases = model['releases']
+        return True
+
+    def _save_cache(self):
+        if self.cache is None:
+            return
+        model = { 'digest': self.digest,
+                  'titles': self.titles,
+                  'latest': self.latestes,
+                  'branches': self.branches,
+                  'releases': self.releases }
+        tmp = self._cache_name() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(model, f)
+        os.replace(tmp, self._cache_name())
+
+    def _index(self):
+        self.release_index = {}
+        for r in self.releases['releases']:
+            self.release_index[r[0]] = r[1]
 
     def load(self,  name):
-        '''Load the configuration INI file. Create titles, branches, and releases.'''
+        '''Load the configuration INI file. Create titles, branches, and releases.
+        The model is loaded from the cache if the INI file has not changed.'''
         self.name = name
+        if self.digest is None:
+            self.digest = config_hash(name)
+        if self._load_cache():
+            self._index()
+            return
         self.config = configparser.ConfigParser()
         try:
             self.config.read(self.name)
@@ -172,14 +246,16 @@ class configuration:
                 rel['doxygen'] = self._get_item(template, 'doxygen', False)
                 if rel['doxygen'] is None:
                     rel['doxygen'] = 'no'
+        self._index()
+        self._save_cache()
 
     def get_release(self, release):
         if self.releases is None:
             self.ctx.fatal('no configuration loaded')
-        for r in self.releases['releases']:
-            if r[0] == release:
-                return r[0], r[1], self.releases[r[1]]
-        self.ctx.fatal('cannot find release: %s' % (release))
+        if release not in self.release_index:
+            self.ctx.fatal('cannot find release: %s' % (release))
+        label = self.release_index[release]
+        return release, label, self.releases[label]
 
     def is_legacy_release(self, release):
         if self.releases is None:
@@ -205,117 +281,202 @@ class configuration:
             self.ctx.fatal('no configuration loaded')
         return sorted([r[0] for r in self.releases['releases']])
 
-    def generate_xml(self):
+    def release_xml_signature(self, release):
+        '''The data a legacy release's XML catalogue is created from. The release's
+        section resolved with its template and the titles of its manuals.'''
+        name, label, rel = self.get_release(release)
+        titles = dict([(m.lower(), self.titles[m.lower()]) for m in rel['manuals']])
+        return json.dumps({ 'name': name,
+                            'label': label,
+                            'release': rel,
+                            'titles': titles },
+                          sort_keys = True)
+
+    def generate_xml(self, release, out):
+        '''Write a legacy release's XML catalogue to the output file.'''
         if self.releases is None:
             self.ctx.fatal('no configuration loaded')
-        for r in self.get_legacy_releases():
-            name, label, rel = self.get_release(r)
-
-            cat = xml.Document()
-
-            root = cat.createElement('rtems-docs')
-            root.setAttribute('date', rel['date'])
-            cat.appendChild(root)
+        name, label, rel = self.get_release(release)
 
-            heading = cat.createElement('catalogue')
-            text = cat.createTextNode(name)
-            heading.appendChild(text)
-            root.appendChild(heading)
+        writer = xml_writer(out)
+        writer.start('rtems-docs', [('date', rel['date'])])
+        writer.element('catalogue', name)
+
+        for m, legacy, name, html, pdf in self._legacy_docs(release):
+            self._xml_doc(writer, m, legacy, name, html, pdf)
+
+        writer.end('rtems-docs')
+
+    def _tag(self, tag):
+        for c in [' ','.',',','(','}','[',']']:
+            tag = tag.replace(c, '_')
+        return tag
+
+    def _branch_entry(self, branch):
+        name = branch[0]
+        path = branch[1]
+        return ['branches/%s/catalogue.xml' % (path),
+                'branches/%s' % (path),
+                self._tag(name),
+                True,
+                name == 'master']
+
+    def _release_entry(self, release):
+        name = release[0]
+        label = release[1]
+        if self.is_legacy_release(name):
+            catalogue = 'releases/%s.xml' % (name)
+            path = 'releases'
+        else:
+            catalogue = 'releases/%s/catalogue.xml' % (label)
+            path = 'releases/%s' % (label)
+        return [catalogue,
+                path,
+                self._tag(name),
+                self.is_doxygen_release(name),
+                False]
+
+    def catalogue_entries(self):
+        '''The catalogue, path, tag, doxygen and show of each branch and release as
+        passed to loadCatalogue.'''
+        if self.releases is None:
+            self.ctx.fatal('no configuration loaded')
+        return [self._branch_entry(b) for b in self.branches] + \
+               [self._release_entry(r) for r in self.releases['releases']]
 
-            for m in rel['manuals']:
-                if 'index_per_doc' in rel:
-                    html = rel['html'] + '/' + m + '/index.html'
-                else:
-                    html = rel['html'] + '/' + m + '.html'
-                pdf = rel['pdf'] + '/' + m + '-' + r + '.pdf'
-                legacy = rel['legacy']
-                doc = self._xml_create_doc(cat, m, legacy, name, html, pdf)
-                root.appendChild(doc)
-
-            catnode = self.ctx.get_cwd().make_node('%s.xml' % (name))
-            catnode.write(cat.toprettyxml(indent = ' ' * 2, newl = os.linesep))
-
-    def generate_html(self, what, indent = 5):
-        def _tag(tag):
-            for c in [' ','.',',','(','}','[',']']:
-                tag = tag.replace(c, '_')
-            return tag
-
-        def _branch_tag(branch):
-            return _tag(branch[0])
-        def _branch_script(branch):
-            name = branch[0]
-            path = branch[1]
-            tag = _branch_tag(branch)
-            if name == 'master':
-                show = 'true'
-            else:
-                show = 'false'
-            return \
-                '<script> loadCatalogue("branches/%s/catalogue.xml", "branches/%s", "%s", true, %s); </script>\n' \
-                % (path, path, tag, show)
-
-        def _release_tag(release):
-            return _tag(release[0])
-        def _release_script(release):
-            name = release[0]
-            label = release[1]
-            tag = _release_tag(release)
-            if self.is_legacy_release(name):
-                catalogue = "releases/%s.xml" % (name)
-                path = 'releases'
+    def _legacy_docs(self, release):
+        name, label, rel = self.get_release(release)
+        for m in rel['manuals']:
+            if 'index_per_doc' in rel:
+                html = rel['html'] + '/' + m + '/index.html'
             else:
-                catalogue = "releases/%s/catalogue.xml" % (label)
-                path = 'releases/%s' % (label)
-            if self.is_doxygen_release(name):
-                doxygen = "true"
+                html = rel['html'] + '/' + m + '.html'
+            pdf = rel['pdf'] + '/' + m + '-' + release + '.pdf'
+            yield m, rel['legacy'], name, html, pdf
+
+    def _read_catalogue(self, catalogue):
+        docs = etree.parse(catalogue).getroot()
+        cat = { 'date': docs.get('date', ''),
+                'title': docs.findtext('catalogue', ''),
+                'docs': [] }
+        for doc in docs.iter('doc'):
+            d = { 'title': doc.findtext('title', '') }
+            for field in ['html', 'pdf', 'singlehtml']:
+                text = doc.findtext(field, '')
+                if text:
+                    d[field] = text
+            cat['docs'] += [d]
+        return cat
+
+    def _bundled(self, entry, catalogues):
+        '''A legacy release is always in the bundle and a release is if its
+        catalogue is in the catalogues directory. A branch's catalogue is
+        published again each time the branch's documentation is built without
+        building the site so it is never in the bundle.'''
+        catalogue = entry[0]
+        if not catalogue.endswith('/catalogue.xml'):
+            return True
+        if not catalogues or not catalogue.startswith('releases/'):
+            return False
+        return os.path.exists(os.path.join(catalogues, catalogue))
+
+    def bundled_catalogues(self, catalogues):
+        '''The catalogues in the bundle.'''
+        return [e[0] for e in self.catalogue_entries()
+                if self._bundled(e, catalogues)]
+
+    def bundle_sources(self, catalogues):
+        '''The catalogue files in the catalogues directory of the releases in
+        the bundle that are not legacy releases.'''
+        return [os.path.join(catalogues, c)
+                for c in self.bundled_catalogues(catalogues)
+                if c.endswith('/catalogue.xml')]
+
+    def bundle_signature(self):
+        '''The data the catalogue bundle is created from less the external
+        catalogue files.'''
+        return json.dumps({ 'entries': self.catalogue_entries(),
+                            'legacy': [self.release_xml_signature(r)
+                                       for r in self.get_legacy_releases()] },
+                          sort_keys = True)
+
+    def generate_bundle(self, catalogues, out, compressed = None):
+        '''Write the catalogue of each branch and release as a single compact
+        JSON object keyed by the catalogue's URL. The legacy releases are
+        created from the configuration and the other releases are read from
+        the catalogues directory if they are present. A gzip compressed copy
+        is written if compressed is a file.'''
+        bundle = {}
+        for e in self.catalogue_entries():
+            if not self._bundled(e, catalogues):
+                continue
+            if e[0].endswith('/catalogue.xml'):
+                bundle[e[0]] = self._read_catalogue(os.path.join(catalogues, e[0]))
             else:
-                doxygen = "false"
-            return \
-                '<script> loadCatalogue("%s", "%s", "%s", %s, false); </script>\n' \
-                % (catalogue, path, tag, doxygen)
-
+                release = e[0][len('releases/'):-len('.xml')]
+                name, label, rel = self.get_release(release)
+                bundle[e[0]] = { 'date': rel['date'],
+                                 'title': name,
+                                 'docs': [{ 'title': self.titles[m.lower()],
+                                            'html': html,
+                                            'pdf': pdf }
+                                          for m, legacy, name, html, pdf in
+                                          self._legacy_docs(release)] }
+        data = json.dumps(bundle, sort_keys = True, separators = (',', ':'))
+        out.write(data)
+        if compressed is not None:
+            with gzip.GzipFile(filename = 'catalogue.json', mode = 'wb',
+                               fileobj = compressed, mtime = 0) as gz:
+                gz.write(data.encode('utf-8'))
+
+    def generate_html(self, what, catalogues, indent = 5):
         def _match_all(tag):
             return True
         def _match_latest_release(tag):
-            return tag == _tag(self.latest('release'))
+            return tag == self._tag(self.latest('release'))
 
         if self.releases is None:
             self.ctx.fatal('no configuration loaded')
 
         if what == 'branches':
             data = self.branches
-            tagger = _branch_tag
-            scripter = _branch_script
+            entry = self._branch_entry
             matcher = _match_all
         elif what == 'releases':
             data = self.releases['releases']
-            tagger = _release_tag
-            scripter = _release_script
+            entry = self._release_entry
             matcher = _match_all
         elif what == 'latest-release':
             data = self.releases['releases']
-            tagger = _release_tag
-            scripter = _release_script
+            entry = self._release_entry
             matcher = _match_latest_release
         else:
             self.ctx.fatal('invalid html type: ' + what)
 
-        scripts = ''
+        entries = []
+        scripts = []
         hindent = ' ' * indent
         html = ''
 
         for d in data:
-            tag = tagger(d)
+            e = entry(d)
+            tag = e[2]
             if matcher(tag):
                 html += hindent + '<div id="rtems-catalogue-%s">\n' % (tag)
                 html += hindent + ' <b>%s</b> No catalogue found.\n' % (d[0])
                 html += hindent + '</div>\n'
-                scripts += ' ' * 3 + scripter(d)
+                if self._bundled(e, catalogues):
+                    entries += [' ' * 5 + json.dumps(e)]
+                else:
+                    scripts += [' ' * 3 + '<script> loadCatalogue(%s); </script>' \
+                                % (', '.join([json.dumps(v) for v in e]))]
 
         html = html[:-1]
-        scripts = scripts[:-1]
-        return html, scripts
+        if len(entries) != 0:
+            scripts += [' ' * 3 + '<script> loadCatalogues("catalogue.json", [\n' + \
+                        ',\n'.join(entries) + '\n' + \
+                        ' ' * 3 + ']); </script>']
+        return html, '\n'.join(scripts)
 
     def latest(self, what):
         if what not in self.latestes:
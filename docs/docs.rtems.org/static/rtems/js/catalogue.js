@@ -52,41 +52,33 @@ function panel_handlers(tag, id, show) {
 	$('#' + id + '1').collapse('show');
 }
 
-function paintCatalogue(xml, path, tag, doxygen, show) {
+/*
+ * Paint a catalogue. The catalogue is an object with the date, title and a
+ * list of docs. A doc has a title and optionally html, pdf and singlehtml
+ * links.
+ */
+function paintCatalogueData(cat, path, tag, doxygen, show) {
     var el_cat = $('#rtems-catalogue-' + tag);
     if (path.slice(-1) != '/')
 	path = path + '/';
-    /*
-     * Use jquery as XMLDocument is consider not stable on Firefox's web site.
-     */
     var pdfIcon = 'static/img/Adobe_PDF_file_icon_32x32.png';
     var htmlIcon = 'static/img/html-xxl.png';
-    var docs = $(xml).find('rtems-docs');
-    var date = $(docs).attr('date');
-    var title = $(docs).find('catalogue');
-    var id = title.text().replace(/\.| |\(|\)|\[|\]/g, '_');
-    var table = catalogueHeader(id, title.text(), date);
+    var id = cat.title.replace(/\.| |\(|\)|\[|\]/g, '_');
+    var table = catalogueHeader(id, cat.title, cat.date);
     var empty = '<td></a></td>\n';
-    $(docs).find('doc').each(function() {
-	var name = $(this).find('name').text();
-	var title = $(this).find('title').text();
-	var release = $(this).find('release').text();
-	var version = $(this).find('version').text();
-	var html = $(this).find('html').text();
-	var pdf = $(this).find('pdf').text();
-	var singlehtml = $(this).find('singlehtml').text();
+    $.each(cat.docs, function(index, doc) {
 	table += '<tr>\n';
-	if (html)
-	    table += '<td><a href="' + path + html + '">' + title + '</a></td>\n';
+	if (doc.html)
+	    table += '<td><a href="' + path + doc.html + '">' + doc.title + '</a></td>\n';
 	else
 	    table += empty;
-	if (pdf)
-	    table += '<td><a href="' + path + pdf + '">' +
+	if (doc.pdf)
+	    table += '<td><a href="' + path + doc.pdf + '">' +
  	    '<img src="' + pdfIcon + '" width="20" height="20"></a></td>\n';
 	else
 	    table += empty;
-	if (singlehtml)
-	    table += '<td><a href="' + path + singlehtml + '">' +
+	if (doc.singlehtml)
+	    table += '<td><a href="' + path + doc.singlehtml + '">' +
 	    '<img src="' + htmlIcon + '" width="20" height="20"></a></td>\n';
 	else
 	    table += empty;
@@ -104,8 +96,53 @@ function paintCatalogue(xml, path, tag, doxygen, show) {
     panel_handlers(tag, id, show);
 }
 
+function paintCatalogue(xml, path, tag, doxygen, show) {
+    /*
+     * Use jquery as XMLDocument is consider not stable on Firefox's web site.
+     */
+    var docs = $(xml).find('rtems-docs');
+    var cat = {
+	date: $(docs).attr('date'),
+	title: $(docs).find('catalogue').text(),
+	docs: []
+    };
+    $(docs).find('doc').each(function() {
+	cat.docs.push({
+	    title: $(this).find('title').text(),
+	    html: $(this).find('html').text(),
+	    pdf: $(this).find('pdf').text(),
+	    singlehtml: $(this).find('singlehtml').text()
+	});
+    });
+    paintCatalogueData(cat, path, tag, doxygen, show);
+}
+
 function loadCatalogue(catalogue, path, tag, doxygen, show) {
     var f = $.get(catalogue, function(xml) {
 	paintCatalogue(xml, path, tag, doxygen, show);
     }, 'xml');
 }
+
+/*
+ * Load the catalogues from the bundle. The bundle is requested once for a
+ * page. A catalogue not in the bundle, or all the catalogues if the bundle
+ * cannot be loaded, are loaded separately.
+ */
+var catalogueBundles = {};
+
+function loadCatalogues(bundle, catalogues) {
+    if (!(bundle in catalogueBundles))
+	catalogueBundles[bundle] = $.getJSON(bundle);
+    catalogueBundles[bundle].done(function(cats) {
+	$.each(catalogues, function(index, c) {
+	    if (c[0] in cats)
+		paintCatalogueData(cats[c[0]], c[1], c[2], c[3], c[4]);
+	    else
+		loadCatalogue(c[0], c[1], c[2], c[3], c[4]);
+	});
+    }).fail(function() {
+	$.each(catalogues, function(index, c) {
+	    loadCatalogue(c[0], c[1], c[2], c[3], c[4]);
+	});
+    });
+}
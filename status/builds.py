@@ -28,29 +28,121 @@
 # POSSIBILITY OF SUCH DAMAGE.
 #
 
+import array
 import base64
+import collections
+import concurrent.futures
+import contextlib
 import datetime
 import email
+import email.utils
+import functools
 import gzip
 import hashlib
+import itertools
+import http.client
 import json
-import mailbox
+import mmap
 import os
 import os.path
 import re
-import shutil
+import sqlite3
+import ssl
+import sys
+import threading
 import time
-import urllib.request
+import urllib.parse
+import zlib
+
+
+# Print a line for each completed month and no percentages
+progress_quiet = False
 
 
 def _print_percentage(what, percent, month):
     if percent > 100:
         percent = 100
+    if progress_quiet:
+        return
     print('\r' + what + ' ' + month + ' ' + \
           '.' * (20 - len(month)) + \
           ' %0.0f%% ' % (percent), end='')
 
 
+def _print_done(what, month, status='done'):
+    if progress_quiet:
+        print('progress: ' + what.lower() + ' ' + month + ' ' + status)
+    elif status == 'done':
+        _print_percentage(what, 100, month)
+        print()
+    else:
+        print(status)
+
+
+def peak_rss():
+    """Return the peak resident set size of the process in bytes or None if
+    not supported on the host."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # MacOS reports bytes, other hosts KB
+    if sys.platform != 'darwin':
+        maxrss *= 1024
+    return maxrss
+
+
+class metrics:
+    """Timing and resource metrics of the stages of a run. A stage can have
+    a record for the whole stage and a record for each month."""
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, stage, month=None, **values):
+        rec = {
+            'stage': stage,
+            'month': month,
+            'wall': 0.0,
+            'bytes': 0,
+            'messages': 0,
+            'cache-hits': 0,
+            'peak-rss': None
+        }
+        rec.update(values)
+        self.records += [rec]
+        return rec
+
+    @contextlib.contextmanager
+    def stage(self, stage, month=None):
+        rec = self.add(stage, month)
+        start = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec['wall'] += time.perf_counter() - start
+            rec['peak-rss'] = peak_rss()
+
+    def save(self, file_name):
+        _save_json(
+            file_name, {
+                'stages': [r for r in self.records if r['month'] is None],
+                'months': [r for r in self.records if r['month'] is not None]
+            },
+            indent=2)
+
+
+def _save_json(file_name, data, indent=None):
+    # Write to a temporary file and rename so a reader never sees a partial
+    # file
+    s = json.dumps(data, sort_keys=True, indent=indent)
+    tmp = file_name + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(s)
+    os.replace(tmp, file_name)
+
+
 def this_year():
     today = datetime.datetime.today()
     return today.year
@@ -111,6 +203,451 @@ def year_months(year, month):
     return years
 
 
+def _mbox_header(lines):
+    # Match the compat32 policy's header value handling
+    value = lines[0].split(':', 1)[1].lstrip(' \t') + ''.join(lines[1:])
+    return value.rstrip('\r\n')
+
+
+def mbox_messages(reader, headers, offset=0, body=None):
+    """Stream the messages in an mbox reader returning the decompressed
+    offset and length of each message and a dict of the headers in the
+    headers list. The reader returns lines as bytes. A missing header is
+    None and message bodies are skipped. The offset is the decompressed
+    offset of the reader's first line. If body is given it is called with
+    the headers of each message when they end and can return a function
+    that is called with each line of the message's body as it is read. The
+    message is returned after its body has been read."""
+
+    def _message(fields):
+        msg = dict([(h, None) for h in headers])
+        for h in fields:
+            msg[h] = _mbox_header(fields[h])
+        return msg
+
+    wanted = dict([(h.lower(), h) for h in headers])
+    fields = None
+    msg = None
+    in_headers = False
+    current = None
+    sink = None
+    start = offset
+    for line in reader:
+        if line.startswith(b'From '):
+            if fields is not None:
+                if msg is None:
+                    msg = _message(fields)
+                yield start, offset - start, msg
+            fields = {}
+            msg = None
+            in_headers = True
+            current = None
+            sink = None
+            start = offset
+            offset += len(line)
+            continue
+        offset += len(line)
+        if not in_headers:
+            if sink is not None:
+                sink(line)
+            continue
+        if line in (b'\n', b'\r\n'):
+            in_headers = False
+            current = None
+            if body is not None:
+                msg = _message(fields)
+                sink = body(msg)
+        elif line[:1] in (b' ', b'\t'):
+            if current is not None:
+                current.append(line.decode('utf-8', errors='replace'))
+        else:
+            current = None
+            name = line.split(b':', 1)[0].strip().lower()
+            header = wanted.get(name.decode('ascii', errors='replace'))
+            if header is not None and header not in fields:
+                current = [line.decode('utf-8', errors='replace')]
+                fields[header] = current
+    if fields is not None:
+        if msg is None:
+            msg = _message(fields)
+        yield start, offset - start, msg
+
+
+subject_record = collections.namedtuple(
+    'subject_record', ['kind', 'result', 'host', 'os', 'buildset'])
+
+#
+# The subject grammar. A build subject is:
+#
+#  Build <host>: <PASSED|FAILED> <buildset> on <os>
+#
+# The first alternative that matches gives the subject's kind. A subject
+# that starts with 'Build ' and is not a valid build is an invalid build.
+#
+re_subject = re.compile(r'^(?:'
+                        r'Build (?P<host>[^:]*):\s*(?P<result>PASSED|FAILED)'
+                        r'\s+(?P<buildset>[^\s:]+)\s+(?P<on>[^\s:]+)'
+                        r'\s+(?P<os>[^\s:]+)(?P<extra>(?:\s+[^\s:]+)*)\s*$'
+                        r'|(?P<invalid>Build )'
+                        r'|(?P<test>\[rtems-test\] )'
+                        r'|(?P<bsp>\[rtems-bsp-builder\] ))')
+
+# The BSP of a test subject and the target and result of a BSP builder
+# subject
+re_test_subject = re.compile(r'^\[rtems-test\]\s+(?P<bsp>[^\s:]+)\s*:')
+re_bsp_build_subject = re.compile(r'^\[rtems-bsp-builder\]\s+'
+                                  r'(?P<target>[^:]+?)\s*:\s*(?P<result>\S+)')
+
+# A count in a subject or a summary line of a body, 'Passed: 10'
+re_subject_count = re.compile(r'(?P<name>[A-Za-z][A-Za-z ]*?)\s*:\s*'
+                              r'(?P<count>[0-9]+)')
+re_body_count = re.compile(rb'^\s*(?P<name>[A-Za-z][A-Za-z ]*?)\s*:\s*'
+                           rb'(?P<count>[0-9]+)\s*$')
+
+# The count names of the test and BSP builder summaries
+test_counts = {'passed': 'passed', 'failed': 'failed', 'timeout': 'timeout'}
+bsp_build_counts = {
+    'passes': 'passes',
+    'passed': 'passes',
+    'failures': 'failures',
+    'failed': 'failures'
+}
+
+
+def count_scanner(names, counts):
+    """Return a function that scans a line of a body for a count of one of
+    the names and sets it in counts so the counts are the last count of
+    each name found. The lines are bytes and only a line that is a count is
+    decoded."""
+    match = re_body_count.match
+
+    def _scan(line):
+        if b':' in line:
+            m = match(line)
+            if m is not None:
+                name = m.group('name').decode('ascii').lower()
+                if name in names:
+                    counts[names[name]] = int(m.group('count'))
+
+    return _scan
+
+
+def merge_counts(a, b):
+    """Return the sum of two dicts of dicts of counts. The keys and names
+    are sorted."""
+    merged = {}
+    for key in sorted(set(a) | set(b)):
+        counts = {}
+        for name in sorted(set(a.get(key, {})) | set(b.get(key, {}))):
+            counts[name] = a.get(key, {}).get(name, 0) + \
+                b.get(key, {}).get(name, 0)
+        merged[key] = counts
+    return merged
+
+
+# Early build logs do not have the host, map the os to a host
+early_build_hosts = [('linux', 'Linux'), ('freebsd', 'FreeBSD'),
+                     ('w64-mingw32', 'MINGW64_NT-10.0'), ('darwin', 'Darwin')]
+
+
+@functools.lru_cache(maxsize=8192)
+def parse_subject(subject):
+    """Parse a subject into a subject record. Build subjects repeat so the
+    records are cached."""
+    m = re_subject.match(subject)
+    if m is None:
+        return subject_record('unknown', None, None, None, None)
+    if m.group('test') is not None:
+        return subject_record('test', None, None, None, None)
+    if m.group('bsp') is not None:
+        return subject_record('bsp-build', None, None, None, None)
+    if m.group('invalid') is not None:
+        return subject_record('invalid-build', None, None, None, None)
+    host = m.group('host').strip()
+    os_ = m.group('os')
+    if host == '':
+        host = 'unknown'
+        if m.group('on') == 'on' and m.group('extra') == '':
+            for label, early_host in early_build_hosts:
+                if label in os_:
+                    host = early_host
+                    break
+    return subject_record('build', m.group('result'), host, os_,
+                          m.group('buildset'))
+
+
+class message:
+    """A compact record of an email in a month's archive. The body is not
+    held and is read from the archive using the message's decompressed
+    offset and length."""
+
+    __slots__ = ('mid', 'mfrom', 'subject', 'date', 'offset', 'length')
+
+    def __init__(self, mid, mfrom, subject, date, offset, length):
+        self.mid = mid
+        self.mfrom = mfrom
+        if subject is None:
+            subject = ''
+        self.subject = subject.replace(os.linesep, '')
+        self.date = date
+        self.offset = offset
+        self.length = length
+
+
+def _tee(reader, writer):
+    for line in reader:
+        writer.write(line)
+        yield line
+
+
+class _crc_reader:
+    """Read lines and keep the CRC-32 of the data read."""
+
+    def __init__(self, reader, crc=0):
+        self.reader = reader
+        self.crc = crc
+
+    def __iter__(self):
+        for line in self.reader:
+            self.crc = zlib.crc32(line, self.crc)
+            yield line
+
+
+class message_index:
+    """An index of the messages in a month's archive. The index maps each
+    Message-ID to the offset and length of the message in a decompressed
+    copy of the archive. The index is stale if the archive's size or
+    modification time changes. A copy can be appended to when a parse is
+    resumed and the messages before the resume offset are kept."""
+
+    def __init__(self, path, archive, mbox):
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+        self.mbox = mbox
+        self.data_filename = os.path.join(path, archive + '.json')
+        self.text_filename = os.path.join(path, archive + '.txt')
+        self.messages = None
+        self.kept = None
+        self.load()
+
+    def _stamp(self):
+        st = os.stat(self.mbox)
+        return [st.st_size, st.st_mtime_ns]
+
+    def valid(self):
+        return self.messages is not None
+
+    def load(self):
+        self.messages = None
+        if os.path.exists(self.data_filename) and \
+           os.path.exists(self.text_filename):
+            with open(self.data_filename, 'r', encoding='utf-8') as f:
+                data = json.loads(f.read())
+            if data['archive'] == self._stamp():
+                self.messages = data['messages']
+
+    def writer(self):
+        self.kept = None
+        return open(self.text_filename + '.tmp', 'wb')
+
+    def appender(self, offset, crc):
+        """Return the decompressed copy opened to append at the offset or
+        None if the copy does not hold the data up to the offset with the
+        CRC-32. Any data after the offset is removed."""
+        if not os.path.exists(self.data_filename) or \
+           not os.path.exists(self.text_filename) or \
+           os.path.getsize(self.text_filename) < offset:
+            return None
+        copy = open(self.text_filename, 'r+b')
+        check = 0
+        remaining = offset
+        while remaining > 0:
+            data = copy.read(min(remaining, 1024 * 1024))
+            check = zlib.crc32(data, check)
+            remaining -= len(data)
+        if check != crc:
+            copy.close()
+            return None
+        copy.truncate(offset)
+        with open(self.data_filename, 'r', encoding='utf-8') as f:
+            data = json.loads(f.read())
+        self.kept = dict([(mid, m) for mid, m in data['messages'].items()
+                          if m[0] + m[1] <= offset])
+        return copy
+
+    def save(self, messages):
+        self.messages = dict([(mid, [msg.offset, msg.length])
+                              for mid, msg in messages.items()
+                              if mid is not None])
+        if self.kept is None:
+            os.replace(self.text_filename + '.tmp', self.text_filename)
+        else:
+            kept = self.kept
+            kept.update(self.messages)
+            self.messages = kept
+            self.kept = None
+        _save_json(self.data_filename, {
+            'archive': self._stamp(),
+            'messages': self.messages
+        })
+
+    def message(self, mid):
+        """Return the message as bytes or None if not in the index."""
+        if self.messages is None or mid not in self.messages:
+            return None
+        offset, length = self.messages[mid]
+        with open(self.text_filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[offset:offset + length]
+
+
+class archive_hasher:
+    """Hash an archive and check it is a valid gzip file as the bytes are
+    seen. The decompressed data is discarded."""
+
+    max_length = 1024 * 1024
+
+    def __init__(self):
+        self.hasher = hashlib.new('sha512')
+        self.gz = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.ok = True
+
+    def update(self, data):
+        self.hasher.update(data)
+        while data and self.ok:
+            if self.gz.eof:
+                # Trailing zeros after the last member are ignored
+                if data.strip(b'\x00') == b'':
+                    break
+                self.gz = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                self.gz.decompress(data, self.max_length)
+                while self.gz.unconsumed_tail:
+                    self.gz.decompress(self.gz.unconsumed_tail,
+                                       self.max_length)
+            except zlib.error:
+                self.ok = False
+            data = self.gz.unused_data
+
+    def valid(self):
+        return self.ok and self.gz.eof
+
+    def sha512(self):
+        return base64.b64encode(self.hasher.digest()).decode('utf-8')
+
+
+class http_connection:
+    """A persistent connection to the host of a base URL. Requests for URLs
+    on other hosts, for example a redirect, use a one off connection that is
+    closed by the next request or when the connection is closed."""
+
+    redirects = [301, 302, 303, 307, 308]
+    max_redirects = 5
+
+    def __init__(self, base):
+        url = urllib.parse.urlsplit(base)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.conn = None
+        self.other = None
+
+    def _connect(self, scheme, netloc):
+        if scheme == 'https':
+            # Match the unverified context urllib was used with
+            context = ssl._create_unverified_context()
+            return http.client.HTTPSConnection(netloc,
+                                               context=context,
+                                               timeout=60)
+        return http.client.HTTPConnection(netloc, timeout=60)
+
+    def _request(self, conn, path, headers):
+        conn.request('GET', path, headers=headers)
+        return conn.getresponse()
+
+    def _close_other(self):
+        if self.other is not None:
+            self.other.close()
+            self.other = None
+
+    def close(self):
+        self._close_other()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def get(self, url, headers={}):
+        self._close_other()
+        for redirect in range(0, self.max_redirects):
+            u = urllib.parse.urlsplit(url)
+            path = u.path
+            if u.query:
+                path += '?' + u.query
+            if (u.scheme, u.netloc) == (self.scheme, self.netloc):
+                if self.conn is None:
+                    self.conn = self._connect(self.scheme, self.netloc)
+                try:
+                    response = self._request(self.conn, path, headers)
+                except (http.client.HTTPException, ConnectionError):
+                    # The server closed the kept alive connection, retry
+                    # once on a new connection
+                    self.close()
+                    self.conn = self._connect(self.scheme, self.netloc)
+                    response = self._request(self.conn, path, headers)
+            else:
+                self._close_other()
+                self.other = self._connect(u.scheme, u.netloc)
+                response = self._request(self.other, path, headers)
+            if response.status not in self.redirects:
+                return response
+            response.read()
+            url = urllib.parse.urljoin(url, response.getheader('Location'))
+        raise RuntimeError('too many redirects: ' + url)
+
+
+def parse_month(archive, mbox, percentage=False, index=None,
+                checkpoint=False, resume=None):
+    """Parse a month's archive and return the build results and the parse
+    statistics. The results do not reference the emails so the call can be
+    made in a worker process. If index is a directory a message index is
+    created in it. If checkpoint is True the statistics contain the parse
+    checkpoint. The resume is the results and checkpoint of an earlier
+    parse of the archive and only the messages after the checkpoint are
+    parsed if the archive still starts with the checkpointed messages."""
+    start = time.perf_counter()
+    email = emails(archive, mbox, index)
+    resumed = False
+    if resume is not None:
+        resumed = email.resume(resume[1], percentage)
+    if not resumed:
+        email.parse(percentage)
+    parsed = time.perf_counter()
+    results = email.build_results()
+    built = time.perf_counter()
+    results.test_runs = email.tests_results()
+    results.bsp_build_runs = email.bsp_build_results()
+    if resumed:
+        results = month_results(
+            results.year, results.month, resume[0].passes + results.passes,
+            resume[0].fails + results.fails,
+            resume[0].test_runs + results.test_runs,
+            resume[0].bsp_build_runs + results.bsp_build_runs)
+    stats = {
+        'parse': parsed - start,
+        'build-results': built - parsed,
+        'tests-results': time.perf_counter() - built,
+        'bytes': os.path.getsize(mbox),
+        'messages': len(email.data['messages']),
+        'builds': len(email.data['builds']),
+        'tests': len(email.data['tests']) + len(email.data['bsp-builds']),
+        'invalid': email.list_invalid(),
+        'peak-rss': peak_rss(),
+        'resumed': resumed
+    }
+    if checkpoint or resumed:
+        stats['checkpoint'] = email.checkpoint()
+    return results, stats
+
+
 class lists:
 
     lists_base = 'https://lists.rtems.org'
@@ -118,6 +655,8 @@ class lists:
     builds_base = mailman_base + '/build'
     builds_ext = '.txt.gz'
 
+    chunk_size = 256 * 1024
+
     #
     # Archives stored in file with the follow path:
     #  https://lists.rtems.org/2022-November.txt.gz
@@ -134,6 +673,9 @@ class lists:
         self.start_month = start_month
         self.iter_months = None
         self.archives_dirty = False
+        self.connections = None
+        self.open_connections = []
+        self.stats = {}
         self.cache = cache
         self.data_filename = os.path.join(self.cache, 'months.json')
         self.load()
@@ -152,93 +694,265 @@ class lists:
 
     def checksum(self, month):
         archive = self.archives[month]
-        hasher = hashlib.new('sha512')
+        hasher = archive_hasher()
         with open(archive['file'], 'rb') as f:
-            hasher.update(f.read())
-        return base64.b64encode(hasher.digest()).decode('utf-8')
-
-    def check_checksum(self, month):
-        if 'sha512' not in self.archives[month]:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        return hasher.sha512()
+
+    def check_checksum(self, month, full=False):
+        """Check the cached archive. The file's size and modification time
+        are checked against the values recorded when the archive was
+        downloaded. The archive is hashed if full is True or there is no
+        recorded time."""
+        archive = self.archives[month]
+        if 'sha512' not in archive:
             return False
-        return self.checksum(month) == self.archives[month]['sha512']
+        if not full and 'mtime' in archive:
+            st = os.stat(archive['file'])
+            return st.st_size == archive['size'] and \
+                st.st_mtime_ns == archive['mtime']
+        if self.checksum(month) != archive['sha512']:
+            return False
+        # Record the time so the next check does not need to hash
+        archive['size'] = os.path.getsize(archive['file'])
+        archive['mtime'] = os.stat(archive['file']).st_mtime_ns
+        self.archives_dirty = True
+        return True
 
     def file_name(self, month):
         if month not in self.archives:
             raise Exception('unknown month: ' + month)
         return self.archives[month]['file']
 
+    def sha512(self, month):
+        if month not in self.archives:
+            raise Exception('unknown month: ' + month)
+        return self.archives[month].get('sha512')
+
     def url(self, month):
         return self.builds_base + '/' + month + self.builds_ext
 
-    def download(self, force=False, percentage=True):
+    def _part_etag(self, part):
+        try:
+            with open(part + '.etag', 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _remove_part(self, part):
+        for f in [part, part + '.etag']:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def _download_request(self, month, force, valid):
+        """Return the request headers for a month. A valid cached archive is
+        fetched conditionally and an interrupted or truncated transfer is
+        resumed with a range request if the entity has not changed."""
+        file_name = os.path.join(self.cache, month + self.builds_ext)
+        part = file_name + '.part'
+        headers = {}
+        if force:
+            self._remove_part(part)
+            return headers
+        archive = self.archives.get(month)
+        if archive is not None and os.path.exists(archive['file']):
+            if valid:
+                if archive.get('etag'):
+                    headers['If-None-Match'] = archive['etag']
+                if archive.get('last-modified'):
+                    headers['If-Modified-Since'] = archive['last-modified']
+                return headers
+            size = os.path.getsize(archive['file'])
+            if archive.get('etag') and size < archive.get('size', 0):
+                os.replace(archive['file'], part)
+                with open(part + '.etag', 'w', encoding='utf-8') as f:
+                    f.write(archive['etag'])
+        etag = self._part_etag(part)
+        if os.path.exists(part) and etag:
+            headers['Range'] = 'bytes=%d-' % (os.path.getsize(part))
+            headers['If-Range'] = etag
+        else:
+            self._remove_part(part)
+        return headers
+
+    def _download_months(self, force, verify):
         today = this_year_month()
         months = self.months()
         if force or len(months) == 0:
             months = month_months(self.start_year, self.start_month)
+        else:
+            # Include any missing months and new months since the last run
+            months = month_months(archive_year(months[0]),
+                                  archive_month(months[0]))
+        load = {}
         for month in months:
-            if percentage:
-                _print_percentage('Downloading', 0, month)
-            load = force
-            if month in self.archives:
-                archive = self.archives[month]
-                if os.path.exists(archive['file']):
-                    if not self.check_checksum(month) or month == today:
-                        load = True
-                if month == today:
-                    load = True
-            else:
-                archive = None
-            if load:
-                _ssl_context = None
-                req = urllib.request.Request(self.url(month))
-                try:
-                    import ssl
-                    _ssl_context = ssl._create_unverified_context()
-                    reader = urllib.request.urlopen(req, context=_ssl_context)
-                except:
-                    _ssl_context = None
-                if _ssl_context is None:
-                    try:
-                        reader = urllib.request.urlopen(req)
-                    except:
-                        return None
-                info = reader.info()
-                if archive is None:
-                    archive = {
-                        'year-month': month,
-                        'year': archive_year(month),
-                        'month': archive_month(month),
-                        'etag': info.get('ETag'),
-                        'size': int(info.get('Content-Length').strip()),
-                        'sha512': '',
-                        'file': os.path.join(self.cache,
-                                             month + self.builds_ext)
-                    }
-                    self.archives[month] = archive
-                    self.archives_dirty = True
-                    load = True
-                with open(archive['file'], 'wb') as writer:
-                    chunk_size = 256 * 1024
-                    size = archive['size']
-                    have = 0
-                    while True:
-                        chunk = reader.read(chunk_size)
-                        if not chunk:
-                            break
-                        writer.write(chunk)
-                        have += chunk_size
+            valid = not force and month in self.archives and \
+                os.path.exists(self.archives[month]['file']) and \
+                self.check_checksum(month, verify)
+            if force or month == today or not valid:
+                load[month] = self._download_request(month, force, valid)
+        return months, load
+
+    def _fetch(self, month, headers, percentage):
+        """Fetch a month's archive using the calling thread's connection.
+        Returns the archive's HTTP details or None if the fetch failed. If
+        the archive has not changed the details are 'not-modified'."""
+        try:
+            conn = self.connections.conn
+        except AttributeError:
+            conn = http_connection(self.builds_base)
+            self.connections.conn = conn
+            self.open_connections += [conn]
+        start = time.perf_counter()
+        try:
+            response = conn.get(self.url(month), headers)
+        except Exception:
+            return None
+        file_name = os.path.join(self.cache, month + self.builds_ext)
+        part = file_name + '.part'
+        if response.status == 304:
+            response.read()
+            return {
+                'not-modified': True,
+                'wall': time.perf_counter() - start,
+                'bytes': 0
+            }
+        if response.status == 416:
+            # The partial transfer does not match, start again
+            response.read()
+            self._remove_part(part)
+            headers = dict([(h, v) for h, v in headers.items()
+                            if h not in ['Range', 'If-Range']])
+            return self._fetch(month, headers, percentage)
+        if response.status not in [200, 206]:
+            response.read()
+            return None
+        have = 0
+        received = 0
+        hasher = archive_hasher()
+        if response.status == 206:
+            content_range = response.getheader('Content-Range', '')
+            m = re.match(r'bytes (\d+)-\d+/(\d+|\*)', content_range)
+            if m is None or int(m.group(1)) != os.path.getsize(part):
+                response.read()
+                self._remove_part(part)
+                return None
+            # Hash and check the bytes already received
+            with open(part, 'rb') as f:
+                while True:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    have += len(chunk)
+            mode = 'ab'
+        else:
+            mode = 'wb'
+            etag = response.getheader('ETag')
+            if etag:
+                with open(part + '.etag', 'w', encoding='utf-8') as f:
+                    f.write(etag)
+        size = response.getheader('Content-Length')
+        if size is not None:
+            size = have + int(size.strip())
+        try:
+            with open(part, mode) as writer:
+                while True:
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    hasher.update(chunk)
+                    have += len(chunk)
+                    received += len(chunk)
+                    if percentage and size:
+                        percent = round((float(have) / size) * 100, 2)
+                        _print_percentage('Downloading', percent, month)
+        except Exception:
+            have = -1
+        if have < 0 or (size is not None and have != size):
+            # Keep the partial transfer so the next download resumes it
+            conn.close()
+            return None
+        if not hasher.valid():
+            self._remove_part(part)
+            return None
+        os.replace(part, file_name)
+        self._remove_part(part)
+        return {
+            'file': file_name,
+            'etag': response.getheader('ETag'),
+            'last-modified': response.getheader('Last-Modified'),
+            'size': have,
+            'mtime': os.stat(file_name).st_mtime_ns,
+            'sha512': hasher.sha512(),
+            'wall': time.perf_counter() - start,
+            'bytes': received
+        }
+
+    def _update(self, month, fetched):
+        if fetched.get('not-modified', False):
+            return
+        if month not in self.archives:
+            self.archives[month] = {
+                'year-month': month,
+                'year': archive_year(month),
+                'month': archive_month(month),
+                'sha512': ''
+            }
+        self.archives[month].update(fetched)
+        self.archives_dirty = True
+
+    def download(self, force=False, percentage=True, jobs=4, verify=False):
+        """Download the archives. The jobs is the number of concurrent
+        downloads and each download thread reuses its connection to the
+        server. If a download fails the other months are still updated and
+        None is returned. Set verify to hash the cached archives rather than
+        checking their size and modification time."""
+        months, load = self._download_months(force, verify)
+        self.stats = {}
+        self.connections = threading.local()
+        self.open_connections = []
+        try:
+            return self._download(months, load, percentage, jobs)
+        finally:
+            for conn in self.open_connections:
+                conn.close()
+            self.connections = None
+            self.open_connections = []
+
+    def _download(self, months, load, percentage, jobs):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            thread_percentage = percentage and jobs == 1
+            fetches = dict([(month,
+                             pool.submit(self._fetch, month, load[month],
+                                         thread_percentage))
+                            for month in load])
+            failed = False
+            for month in months:
+                if percentage:
+                    _print_percentage('Downloading', 0, month)
+                if month in fetches:
+                    fetched = fetches[month].result()
+                    if fetched is None:
                         if percentage:
-                            percent = round((float(have) / size) * 100, 2)
-                            _print_percentage('Downloading', percent, month)
-                with gzip.open(archive['file'], 'rb') as gz:
-                    pass
-                archive['etag'] = info.get('ETag')
-                archive['size'] = int(info.get('Content-Length').strip())
-                archive['sha512'] = self.checksum(month)
-                reader.close()
-            if percentage:
-                _print_percentage('Downloading', 100, month)
-                print()
+                            _print_done('Downloading', month, 'failed')
+                        failed = True
+                        continue
+                    self.stats[month] = {
+                        'wall': fetched.pop('wall'),
+                        'bytes': fetched.pop('bytes')
+                    }
+                    self._update(month, fetched)
+                if percentage:
+                    _print_done('Downloading', month)
+        if failed:
+            return None
+        return months
 
     def load(self):
         if self.archives_dirty:
@@ -249,9 +963,8 @@ class lists:
 
     def save(self):
         if self.archives_dirty:
-            s = json.dumps(self.archives, sort_keys=True, indent=2)
-            with open(self.data_filename, 'w', encoding='utf-8') as f:
-                f.write(s)
+            _save_json(self.data_filename, self.archives, indent=2)
+            self.archives_dirty = False
 
     def months(self):
         start_datetime = datetime.date(self.start_year, self.start_month,
@@ -264,7 +977,52 @@ class lists:
         return mnts
 
 
+class category:
+    """An interned table of the values of a category such as the hosts. A
+    value's code is its index in the table. The codes are local to the
+    process."""
+
+    def __init__(self, name, values=[]):
+        self.name = name
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.code(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        c = self.codes.get(value)
+        if c is None:
+            c = len(self.values)
+            value = sys.intern(value)
+            self.values += [value]
+            self.codes[value] = c
+        return c
+
+    def find(self, value):
+        """Return the code of a value or None if the value is not in the
+        table."""
+        return self.codes.get(value)
+
+    def value(self, code):
+        return self.values[code]
+
+    def decode(self, codes):
+        return sorted([self.values[c] for c in codes])
+
+
 class month_results:
+    """The build results of a month. The records are held in array columns
+    of the codes of the interned host, os, buildset and result values, an
+    array of the UTC dates in seconds since the epoch and an array of the
+    Message-ID digests. A date is formatted when a record is returned. The
+    architecture of a buildset is found once when the buildset is
+    interned. The test and BSP build runs are the month's [rtems-test] and
+    [rtems-bsp-builder] reports as the Message-ID digest, the BSP or target
+    and the report's counts. The tests and BSP builds are the runs' counts
+    of each BSP and target."""
 
     re_rtems_buildset = re.compile('^[0-9]+/rtems-.*$')
 
@@ -275,15 +1033,62 @@ class month_results:
         'riscv32', 'riscv64', 'sh', 'sparc', 'sparc64', 'v850', 'x86_64'
     ]
 
-    def __init__(self, year, month, passes, fails):
+    categories = {
+        'host': category('host'),
+        'os': category('os'),
+        'buildset': category('buildset'),
+        'arch': category('arch'),
+        'result': category('result', ['PASSED', 'FAILED'])
+    }
+
+    # The arch code of each buildset code, -1 is not an RTEMS arch
+    buildset_arch_codes = array.array('i')
+
+    columns = ['host', 'os', 'buildset', 'result']
+
+    PASSED = 0
+    FAILED = 1
+
+    # The count names of the test and BSP builder runs
+    test_names = ['passed', 'failed', 'timeout']
+    bsp_build_names = ['passes', 'failures']
+
+    # The date of a record without a date
+    no_date = -(1 << 63)
+
+    epoch = datetime.datetime(1970, 1, 1)
+    epoch_ordinal = epoch.toordinal()
+
+    def __init__(self,
+                 year,
+                 month,
+                 passes,
+                 fails,
+                 test_runs=None,
+                 bsp_build_runs=None):
         self.year = year
         self.month = month
-        self.passes = passes
-        self.fails = fails
+        if test_runs is None:
+            test_runs = []
+        if bsp_build_runs is None:
+            bsp_build_runs = []
+        self.test_runs = test_runs
+        self.bsp_build_runs = bsp_build_runs
+        self.data = dict([(c, array.array('I')) for c in self.columns])
+        self.dates = array.array('q')
+        self.mids = array.array('Q')
+        for rec in passes + fails:
+            self.add(rec)
+
+    def __reduce__(self):
+        # The codes are local to a process so pickle the records
+        return (month_results,
+                (self.year, self.month, self.passes, self.fails,
+                 self.test_runs, self.bsp_build_runs))
 
     def __str__(self):
-        o = 'total: %5d  passes: %5d  fails %5d' % (len(self.passes) + len(
-            self.fails), len(self.passes), len(self.fails))
+        o = 'total: %5d  passes: %5d  fails %5d' % (
+            self.builds_count(), self.passes_count(), self.fails_count())
         return o
 
     @staticmethod
@@ -300,99 +1105,649 @@ class month_results:
         ]
 
     @staticmethod
-    def _get_list(key, recs):
-        return sorted(list(set(r[key] for r in recs)))
+    def date_seconds(date):
+        """Return a 'YYYY-MM-DD HH:MM:SS' UTC date as seconds since the
+        epoch."""
+        if date is None:
+            return month_results.no_date
+        dt = datetime.datetime.fromisoformat(date)
+        return (dt.toordinal() - month_results.epoch_ordinal) * 86400 + \
+            dt.hour * 3600 + dt.minute * 60 + dt.second
+
+    @staticmethod
+    def seconds_date(seconds):
+        """Return seconds since the epoch as a 'YYYY-MM-DD HH:MM:SS' UTC
+        date."""
+        if seconds == month_results.no_date:
+            return None
+        return (month_results.epoch +
+                datetime.timedelta(seconds=seconds)).isoformat(' ')
 
-    def _get_passed_list(self, key):
-        return self._get_list(key, self.passes)
+    @staticmethod
+    def buildset_code(bset):
+        buildsets = month_results.categories['buildset']
+        code = buildsets.code(bset)
+        arch_codes = month_results.buildset_arch_codes
+        while len(arch_codes) < len(buildsets):
+            bs = buildsets.value(len(arch_codes))
+            if month_results._rtems_arch(bs):
+                arch = month_results.categories['arch'].code(
+                    bs.replace('.bset', ''))
+            else:
+                arch = -1
+            arch_codes.append(arch)
+        return code
+
+    @staticmethod
+    def buildset_arch(bset):
+        """Return the RTEMS architecture of a buildset or None if the buildset
+        is not an RTEMS architecture build."""
+        arch = month_results.buildset_arch_codes[month_results.buildset_code(
+            bset)]
+        if arch < 0:
+            return None
+        return month_results.categories['arch'].value(arch)
+
+    def add(self, rec):
+        for c in ['host', 'os', 'result']:
+            self.data[c].append(self.categories[c].code(rec[c]))
+        self.data['buildset'].append(self.buildset_code(rec['buildset']))
+        self.dates.append(self.date_seconds(rec.get('date')))
+        self.mids.append(rec.get('mid', 0))
+
+    def records(self, result=None):
+        """Return the records as a list of dicts. If result is not None only
+        the records with the result are returned."""
+        recs = []
+        values = [self.categories[c].values for c in self.columns]
+        for n, codes in enumerate(zip(*[self.data[c] for c in self.columns])):
+            if result is None or codes[3] == result:
+                rec = dict([(c, v[code]) for c, v, code in zip(
+                    self.columns, values, codes)])
+                if self.dates[n] != self.no_date:
+                    rec['date'] = self.seconds_date(self.dates[n])
+                if self.mids[n] != 0:
+                    rec['mid'] = self.mids[n]
+                recs += [rec]
+        return recs
+
+    @property
+    def passes(self):
+        return self.records(self.PASSED)
+
+    @property
+    def fails(self):
+        return self.records(self.FAILED)
 
-    def _get_failed_list(self, key):
-        return self._get_list(key, self.failed)
+    @staticmethod
+    def _run_counts(runs, names):
+        counts = {}
+        for mid, key, run in runs:
+            if key not in counts:
+                counts[key] = dict([(name, 0) for name in ['runs'] + names])
+            counts[key]['runs'] += 1
+            for name, count in run.items():
+                counts[key][name] += count
+        return merge_counts(counts, {})
+
+    @property
+    def tests(self):
+        return self._run_counts(self.test_runs, self.test_names)
+
+    @property
+    def bsp_builds(self):
+        return self._run_counts(self.bsp_build_runs, self.bsp_build_names)
+
+    def digests(self):
+        """Return the Message-ID digests of the build records and the test and
+        BSP builder runs."""
+        return list(self.mids) + \
+            [run[0] for run in self.test_runs + self.bsp_build_runs]
+
+    def without(self, mids):
+        """Return the results without the records and runs of the
+        Message-ID digests."""
+        if len(mids) == 0:
+            return self
+        return month_results(
+            self.year, self.month,
+            [rec for rec in self.passes if rec.get('mid', 0) not in mids],
+            [rec for rec in self.fails if rec.get('mid', 0) not in mids],
+            [run for run in self.test_runs if run[0] not in mids],
+            [run for run in self.bsp_build_runs if run[0] not in mids])
+
+    def _codes(self, key, result=None):
+        if result is None:
+            return set(self.data[key])
+        return set([
+            code for code, r in zip(self.data[key], self.data['result'])
+            if r == result
+        ])
+
+    def _arch_codes(self, result=None):
+        arch_codes = self.buildset_arch_codes
+        return set([arch_codes[c] for c in self._codes('buildset', result)
+                    ]) - set([-1])
+
+    def _get_list(self, key, result=None):
+        return self.categories[key].decode(self._codes(key, result))
+
+    def daily_counts(self, key):
+        """Return the passes and fails of each day for each host or arch as
+        {value: {'YYYY-MM-DD': [passes, fails]}}. Records without a date are
+        not counted."""
+        if key == 'arch':
+            arch_codes = self.buildset_arch_codes
+            codes = [arch_codes[c] for c in self.data['buildset']]
+        else:
+            codes = self.data[key]
+        days = {}
+        for code, result, date in zip(codes, self.data['result'], self.dates):
+            if code < 0 or date == self.no_date:
+                continue
+            counts = days.setdefault((code, date // 86400), [0, 0])
+            counts[result] += 1
+        values = self.categories[key].values
+        names = {}
+        daily = {}
+        for (code, day), counts in days.items():
+            if day not in names:
+                names[day] = datetime.date.fromordinal(
+                    self.epoch_ordinal + day).isoformat()
+            daily.setdefault(values[code], {})[names[day]] = counts
+        return daily
+
+    def builds_count(self):
+        return len(self.data['result'])
+
+    def passes_count(self):
+        return self.data['result'].count(self.PASSED)
+
+    def fails_count(self):
+        return self.data['result'].count(self.FAILED)
 
     def has_builds(self):
-        return (len(self.passes) + len(self.fails)) != 0
+        return self.builds_count() != 0
 
     def hosts(self):
-        return self._get_list('host', self.fails + self.passes)
+        return self._get_list('host')
 
     def buildsets(self):
-        return self._get_list('buildset', self.fails + self.passes)
+        return self._get_list('buildset')
 
     def rtems_archs(self):
-        return [
-            bs.replace('.bset', '') for bs in self.buildsets()
-            if self._rtems_arch(bs)
-        ]
+        return self.categories['arch'].decode(self._arch_codes())
 
     def passed_host(self):
-        return self._get_passed_list('host')
+        return self._get_list('host', self.PASSED)
 
     def passed_buildsets(self):
-        return self._get_passed_list('buildset')
+        return self._get_list('buildset', self.PASSED)
 
     def passed_rtems_archs(self):
-        return [bs for bs in self.passed_buildsets() if self._rtems_arch(bs)]
+        return self.categories['arch'].decode(self._arch_codes(self.PASSED))
 
     def failed_hosts(self):
-        return self._get_list('host', self.fails)
+        return self._get_list('host', self.FAILED)
 
     def failed_buildsets(self):
-        return self._get_list('buildset', self.fails)
+        return self._get_list('buildset', self.FAILED)
 
     def failed_rtems_archs(self):
-        return [bs for bs in self.failed_buildsets() if self._rtems_arch(bs)]
-
-    def failed_rtems_arch_builds(self):
-        failed_hosts = self.failed_hosts()
-        failed_rtems_archs = []
-        for arch in self.failed_rtems_archs():
-            print(arch)
-            xx
-            hosts = set([r['host'] for r in self.fails if r['arch'] == arch])
-            if not set(failed_hosts).isdisjoint(hosts):
-                print(arch, '%d: %r  ' % (len(failed_hosts), failed_hosts),
-                      '%d: %r' % (len(hosts), hosts))
-                failed_archs += [arch]
-        return failed_archs
+        return self.categories['arch'].decode(self._arch_codes(self.FAILED))
+
+    def host_bitsets(self, key):
+        """Return the bitsets of the hosts that passed and failed each arch
+        or buildset as {code: [passed, failed]}. Bit n of a bitset is the
+        host with code n."""
+        arch_codes = self.buildset_arch_codes
+        bitsets = {}
+        for host, bset, result in zip(self.data['host'],
+                                      self.data['buildset'],
+                                      self.data['result']):
+            if key == 'arch':
+                code = arch_codes[bset]
+                if code < 0:
+                    continue
+            else:
+                code = bset
+            if code not in bitsets:
+                bitsets[code] = [0, 0]
+            bitsets[code][result] |= 1 << host
+        return bitsets
+
+    def rtems_arch_failures(self):
+        return failure_correlation.classify(self.host_bitsets('arch'),
+                                            'arch')
+
+
+class failure_correlation:
+    """Correlate the failures of archs and buildsets with the hosts. The
+    hosts that passed and failed an arch or buildset in a month are held
+    as bitsets so the classification is a few integer operations. A host
+    fails an arch if all its builds of the arch failed. An arch fails on
+    all hosts if every host that built it failed and there is more than
+    one host, it is host specific if some hosts failed and others passed,
+    and it is single host if the only host to build it failed. A month is
+    classified from its results' bitsets so nothing is held between
+    months."""
+
+    @staticmethod
+    def _hosts(bits):
+        hosts = []
+        while bits:
+            low = bits & -bits
+            hosts += [low.bit_length() - 1]
+            bits ^= low
+        return month_results.categories['host'].decode(hosts)
+
+    @staticmethod
+    def classify(bitsets, key):
+        """Classify the failures of the bitsets of an arch or buildset
+        key."""
+        category = month_results.categories[key]
+        classes = {'all-hosts': [], 'host-specific': {}, 'single-host': {}}
+        for code in sorted(bitsets, key=category.value):
+            passed, failed = bitsets[code]
+            failing = failed & ~passed
+            if failing == 0:
+                continue
+            built = passed | failed
+            value = category.value(code)
+            if failing != built:
+                classes['host-specific'][value] = \
+                    failure_correlation._hosts(failing)
+            elif built & (built - 1) != 0:
+                classes['all-hosts'] += [value]
+            else:
+                classes['single-host'][value] = \
+                    failure_correlation._hosts(failing)[0]
+        return classes
+
+
+class results_cache:
+    """Per-month build results cache stored next to the archive data. Each
+    month is a file so only the months used are loaded. An entry is only
+    valid if the archive checksum and the parser version match the values
+    used to create it. An entry can hold the parse checkpoint of a month
+    whose archive is still growing."""
+
+    def __init__(self, cache):
+        self.cache = os.path.join(cache, 'results')
+        if not os.path.exists(self.cache):
+            os.mkdir(self.cache)
+
+    def _file_name(self, month):
+        return os.path.join(self.cache, month + '.json')
+
+    def _load(self, month):
+        if not os.path.exists(self._file_name(month)):
+            return None
+        with open(self._file_name(month), 'r', encoding='utf-8') as f:
+            entry = json.loads(f.read())
+        if entry['parser'] != emails.parser_version:
+            return None
+        return entry
+
+    def get(self, month, sha512):
+        if not sha512:
+            return None
+        entry = self._load(month)
+        if entry is None or entry['sha512'] != sha512:
+            return None
+        return month_results(entry['year'], entry['month'], entry['passes'],
+                             entry['fails'], entry['test-runs'],
+                             entry['bsp-build-runs'])
+
+    def checkpoint(self, month):
+        """Return the results and the checkpoint of the month's last parse
+        whatever the archive's checksum or None if there is no
+        checkpoint."""
+        entry = self._load(month)
+        if entry is None or 'checkpoint' not in entry:
+            return None
+        return (month_results(entry['year'], entry['month'], entry['passes'],
+                              entry['fails'], entry['test-runs'],
+                              entry['bsp-build-runs']), entry['checkpoint'])
+
+    def put(self, month, sha512, results, checkpoint=None):
+        if not sha512:
+            return
+        entry = {
+            'sha512': sha512,
+            'parser': emails.parser_version,
+            'year': results.year,
+            'month': results.month,
+            'passes': results.passes,
+            'fails': results.fails,
+            'test-runs': results.test_runs,
+            'bsp-build-runs': results.bsp_build_runs
+        }
+        if checkpoint is not None:
+            entry['checkpoint'] = checkpoint
+        _save_json(self._file_name(month), entry)
+
+
+def message_id_digest(mid):
+    """Return the 64-bit digest of a Message-ID. A missing Message-ID is
+    0."""
+    if mid is None:
+        return 0
+    return int.from_bytes(hashlib.blake2b(mid.encode('utf-8', 'replace'),
+                                          digest_size=8).digest(),
+                          'little') or 1
+
+
+class message_ids:
+    """The Message-ID digests of the build records and the test and BSP
+    builder reports of every month in the cache. A message in more than one month's archive belongs to the
+    earliest month and is a duplicate in the later months. Each month's
+    digests are held as an array and a dict maps a digest to the month it
+    belongs to so a lookup is a constant cost. The few digests in more
+    than one month have the list of their months. A month is current if
+    the archive's checksum has not changed."""
+
+    def __init__(self, cache):
+        self.data_filename = os.path.join(cache, 'message-ids.json')
+        self.months = {}
+        self.sha512 = {}
+        self.owner = {}
+        self.shared = {}
+        self.dirty = False
+        self.load()
+
+    def __contains__(self, month):
+        return month in self.months
+
+    @staticmethod
+    def _key(month):
+        return (archive_year(month), archive_month(month))
+
+    def _holders(self, mid):
+        if mid in self.shared:
+            return self.shared[mid]
+        if mid in self.owner:
+            return [self.owner[mid]]
+        return []
+
+    def _add(self, mid, month):
+        if mid not in self.owner:
+            self.owner[mid] = month
+            return
+        holders = sorted(self._holders(mid) + [month], key=self._key)
+        self.shared[mid] = holders
+        self.owner[mid] = holders[0]
+
+    def _remove(self, mid, month):
+        if mid not in self.shared:
+            del self.owner[mid]
+            return
+        holders = [m for m in self.shared[mid] if m != month]
+        if len(holders) == 1:
+            del self.shared[mid]
+        else:
+            self.shared[mid] = holders
+        self.owner[mid] = holders[0]
+
+    def current(self, month, sha512):
+        return sha512 is not None and self.sha512.get(month) == sha512
+
+    def put(self, month, sha512, results):
+        """Replace the month's digests with the digests of the results and
+        return the other months that hold any of the old or new digests.
+        The duplicates in those months may have changed."""
+        mids = array.array('Q', sorted(set(results.digests()) - set([0])))
+        old = self.months.get(month, array.array('Q'))
+        for mid in old:
+            self._remove(mid, month)
+        for mid in mids:
+            self._add(mid, month)
+        self.months[month] = mids
+        self.sha512[month] = sha512
+        self.dirty = True
+        affected = set()
+        for mid in set(old) | set(mids):
+            affected.update(self._holders(mid))
+        affected.discard(month)
+        return sorted(affected, key=self._key)
+
+    def duplicates(self, month, results):
+        """Return the digests of the results that belong to an earlier
+        month."""
+        owner = self.owner
+        return set([
+            mid for mid in results.digests()
+            if mid != 0 and owner.get(mid, month) != month
+        ])
+
+    def load(self):
+        if os.path.exists(self.data_filename):
+            with open(self.data_filename, 'r', encoding='utf-8') as f:
+                data = json.loads(f.read())
+            if data['parser'] != emails.parser_version or \
+               data['byteorder'] != sys.byteorder:
+                return
+            for month in data['months']:
+                mids = array.array('Q')
+                mids.frombytes(base64.b64decode(data['months'][month]))
+                self.months[month] = mids
+                for mid in mids:
+                    self._add(mid, month)
+            self.sha512 = data['sha512']
+
+    def save(self):
+        if self.dirty:
+            _save_json(
+                self.data_filename, {
+                    'parser': emails.parser_version,
+                    'byteorder': sys.byteorder,
+                    'sha512': self.sha512,
+                    'months': dict([
+                        (month, base64.b64encode(mids.tobytes()).decode())
+                        for month, mids in self.months.items()
+                    ])
+                })
+            self.dirty = False
+
+
+class summary_cache:
+    """The per-month summaries the last report was created from and the
+    archive checksums of those months. A change of parser version or of the
+    summary version discards all the months."""
+
+    version = 5
+
+    def __init__(self, cache):
+        self.data_filename = os.path.join(cache, 'summaries.json')
+        self.months = {}
+        self.dirty = False
+        self.load()
+
+    def get(self, month, sha512):
+        if not sha512 or month not in self.months:
+            return None
+        if self.months[month]['sha512'] != sha512:
+            return None
+        return self.months[month]['summary']
+
+    def put(self, month, sha512, summary):
+        if not sha512:
+            return
+        self.months[month] = {'sha512': sha512, 'summary': summary}
+        self.dirty = True
+
+    def load(self):
+        if os.path.exists(self.data_filename):
+            with open(self.data_filename, 'r', encoding='utf-8') as f:
+                data = json.loads(f.read())
+            if data['parser'] == emails.parser_version and \
+               data.get('version') == self.version:
+                self.months = data['months']
+
+    def save(self):
+        if self.dirty:
+            _save_json(self.data_filename, {
+                'parser': emails.parser_version,
+                'version': self.version,
+                'months': self.months
+            })
+            self.dirty = False
+
+
+class results_db:
+    """A SQLite database of the build records. The records of each archive
+    are replaced when the archive's checksum or the parser version
+    changes."""
+
+    fields = ['date', 'host', 'os', 'buildset', 'arch', 'result']
+
+    schema = \
+        'CREATE TABLE IF NOT EXISTS archives (' \
+        ' archive TEXT PRIMARY KEY, sha512 TEXT, parser INTEGER);' \
+        'CREATE TABLE IF NOT EXISTS builds (' \
+        ' archive TEXT, year INTEGER, month INTEGER, date TEXT,' \
+        ' host TEXT, os TEXT, buildset TEXT, arch TEXT, result TEXT);' \
+        'CREATE INDEX IF NOT EXISTS builds_archive ON builds (archive);' \
+        'CREATE INDEX IF NOT EXISTS builds_date ON builds (date);' \
+        'CREATE INDEX IF NOT EXISTS builds_host ON builds (host);' \
+        'CREATE INDEX IF NOT EXISTS builds_os ON builds (os);' \
+        'CREATE INDEX IF NOT EXISTS builds_buildset ON builds (buildset);' \
+        'CREATE INDEX IF NOT EXISTS builds_arch ON builds (arch);' \
+        'CREATE INDEX IF NOT EXISTS builds_result ON builds (result);'
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.db = sqlite3.connect(file_name)
+        self.db.executescript(self.schema)
+
+    def close(self):
+        self.db.close()
+
+    def current(self, archive, sha512):
+        row = self.db.execute(
+            'SELECT sha512, parser FROM archives WHERE archive = ?',
+            (archive, )).fetchone()
+        return row is not None and \
+            row[0] == sha512 and row[1] == emails.parser_version
+
+    def add(self, archive, sha512, results):
+        recs = [(archive, results.year, results.month, rec.get('date'),
+                 rec['host'], rec['os'], rec['buildset'],
+                 month_results.buildset_arch(rec['buildset']), rec['result'])
+                for rec in results.passes + results.fails]
+        with self.db:
+            self.db.execute('DELETE FROM builds WHERE archive = ?',
+                            (archive, ))
+            self.db.executemany(
+                'INSERT INTO builds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                recs)
+            self.db.execute('INSERT OR REPLACE INTO archives VALUES (?, ?, ?)',
+                            (archive, sha512, emails.parser_version))
+
+    def _where(self, filters):
+        where = []
+        values = []
+        for field in ['host', 'os', 'buildset', 'arch', 'result']:
+            if filters.get(field) is not None:
+                where += [field + ' = ?']
+                values += [filters[field]]
+        if filters.get('start') is not None:
+            where += ['date >= ?']
+            values += [filters['start']]
+        if filters.get('end') is not None:
+            end = filters['end']
+            if len(end) == len('YYYY-MM-DD'):
+                end += ' 23:59:59'
+            where += ['date <= ?']
+            values += [end]
+        if len(where) == 0:
+            return '', values
+        return ' WHERE ' + ' AND '.join(where), values
+
+    def query(self, **filters):
+        """Return the build records matching the filters. The filters are
+        the host, os, buildset, arch and result and a start and end date as
+        YYYY-MM-DD."""
+        where, values = self._where(filters)
+        cur = self.db.execute(
+            'SELECT ' + ', '.join(self.fields) + ' FROM builds' + where +
+            ' ORDER BY date', values)
+        return [dict(zip(self.fields, row)) for row in cur]
+
+    def count(self, group_by=[], **filters):
+        """Count the build records matching the filters. If group_by is a
+        list of fields the counts are returned as a list of tuples of the
+        field values followed by the count."""
+        for field in group_by:
+            if field not in self.fields:
+                raise ValueError('invalid group by field: ' + field)
+        where, values = self._where(filters)
+        if len(group_by) == 0:
+            return self.db.execute('SELECT COUNT(*) FROM builds' + where,
+                                   values).fetchone()[0]
+        fields = ', '.join(group_by)
+        return self.db.execute(
+            'SELECT ' + fields + ', COUNT(*) FROM builds' + where +
+            ' GROUP BY ' + fields + ' ORDER BY ' + fields, values).fetchall()
 
 
 class year_results:
+    """The build results for the years. An aggregate index is built as each
+    month is added and the queries are index lookups. The counts are keyed
+    by the codes of (year, month, host, arch, buildset, result) where the
+    arch is -1 if the buildset is not an RTEMS architecture."""
 
     def __init__(self):
         self.years = {}
+        self.counts = collections.Counter()
+        self.months = {}
 
     def _years_months(self, year, month):
         if year is None:
             years = list(self.years)
         else:
             years = [year]
-        count = 0
         if month is None:
-            months = list(range(0, 12))
+            months = list(range(1, 13))
         else:
             months = [month]
         return years, months
 
-    def _sweep_counter(self, year, month, action):
+    def _sweep_counter(self, year, month, key):
         years, months = self._years_months(year, month)
         count = 0
         for year in years:
             for month in months:
-                results = self.years[year][month - 1]
-                if results is not None:
-                    count += action(results)
+                if (year, month) in self.months:
+                    count += self.months[(year, month)][key]
         return count
 
-    def _sweep_list(self, year, month, action):
+    def _sweep_list(self, year, month, key, category):
         years, months = self._years_months(year, month)
-        l = []
+        s = set()
         for year in years:
             for month in months:
-                results = self.years[year][month - 1]
-                if results is not None:
-                    d = action(results)
-                    l += action(results)
-        return sorted(list(set(l)))
+                if (year, month) in self.months:
+                    s |= self.months[(year, month)][key]
+        return month_results.categories[category].decode(s)
+
+    def _index(self, year, month, results):
+        arch_codes = month_results.buildset_arch_codes
+        for host, bset, result in zip(results.data['host'],
+                                      results.data['buildset'],
+                                      results.data['result']):
+            self.counts[(year, month, host, arch_codes[bset], bset,
+                         result)] += 1
+        hosts = results._codes('host')
+        archs = results._arch_codes()
+        self.months[(year, month)] = {
+            'passes': results.passes_count(),
+            'fails': results.fails_count(),
+            'hosts': hosts,
+            'hosts-count': len(hosts),
+            'archs': archs,
+            'archs-count': len(archs)
+        }
 
     def add(self, year, month, results):
         if year not in self.years:
@@ -400,51 +1755,106 @@ class year_results:
         if self.years[year][month - 1] is not None:
             raise RuntimeError('month set in year results: ' + str(month))
         self.years[year][month - 1] = results
+        self._index(year, month, results)
+
+    def breakdown(self,
+                  key,
+                  year=None,
+                  month=None,
+                  host=None,
+                  arch=None,
+                  buildset=None):
+        """Return the passes and fails of each value of the key, host, arch
+        or buildset, for the builds matching the fields that are not None.
+        The counts are found in a single pass of the index."""
+        fields = ['year', 'month', 'host', 'arch', 'buildset', 'result']
+        match = []
+        for c, value in [('year', year), ('month', month), ('host', host),
+                         ('arch', arch), ('buildset', buildset)]:
+            if value is not None:
+                if c not in ['year', 'month']:
+                    value = month_results.categories[c].find(value)
+                    if value is None:
+                        return {}
+                match += [(fields.index(c), value)]
+        k = fields.index(key)
+        counts = {}
+        for fkey, value in self.counts.items():
+            if fkey[k] < 0 or not all([fkey[i] == v for i, v in match]):
+                continue
+            if fkey[k] not in counts:
+                counts[fkey[k]] = [0, 0]
+            counts[fkey[k]][fkey[5]] += value
+        category = month_results.categories[key]
+        return dict([(category.value(code), {
+            'passes': counts[code][month_results.PASSED],
+            'fails': counts[code][month_results.FAILED]
+        }) for code in sorted(counts, key=category.value)])
 
     def builds_count(self, year=None, month=None):
         return self.passes_count(year, month) + self.fails_count(year, month)
 
     def passes_count(self, year=None, month=None):
-        return self._sweep_counter(year, month,
-                                   lambda results: len(results.passes))
+        return self._sweep_counter(year, month, 'passes')
 
     def fails_count(self, year=None, month=None):
-        return self._sweep_counter(year, month,
-                                   lambda results: len(results.fails))
+        return self._sweep_counter(year, month, 'fails')
 
     def hosts(self, year=None, month=None):
-        return self._sweep_list(year, month, lambda results: results.hosts())
+        return self._sweep_list(year, month, 'hosts', 'host')
 
     def hosts_count(self, year=None, month=None):
-        return self._sweep_counter(year, month,
-                                   lambda results: len(results.hosts()))
+        return self._sweep_counter(year, month, 'hosts-count')
 
     def rtems_archs(self, year=None, month=None):
-        return self._sweep_list(year, month,
-                                lambda results: results.rtems_archs())
+        return self._sweep_list(year, month, 'archs', 'arch')
 
     def rtems_archs_count(self, year=None, month=None):
-        return self._sweep_counter(year, month,
-                                   lambda results: len(results.rtems_archs()))
+        return self._sweep_counter(year, month, 'archs-count')
 
 
 class emails:
 
-    def __init__(self, archive, mbox):
+    # Bump when a change alters the parsed results so cached results are
+    # discarded
+    parser_version = 5
+
+    # The headers the classifier and build results use
+    headers = ['Message-ID', 'From', 'Subject', 'Date']
+
+    # The count names of the subject kinds with a summary in the body
+    body_counts = {'test': test_counts, 'bsp-build': bsp_build_counts}
+
+    # The data bucket of each subject kind
+    buckets = {
+        'build': 'builds',
+        'invalid-build': 'builds',
+        'test': 'tests',
+        'bsp-build': 'bsp-builds',
+        'unknown': 'unknown'
+    }
+
+    def __init__(self, archive, mbox, index=None):
         self.archive = archive
         self.year = archive_year(archive)
         self.month = archive_month(archive)
         self.mbox = mbox
+        if index is not None:
+            index = message_index(index, archive, mbox)
+        self.index = index
         self.data = {
             'messages': {},
             'from': {},
             'builds': [],
             'tests': [],
             'bsp-builds': [],
+            'counts': {},
             'unknown': [],
+            'invalid': [],
             'pass': {},
             'fail': {}
         }
+        self.parsed = None
 
     def __str__(self):
         s = [self.archive + ':']
@@ -466,88 +1876,240 @@ class emails:
         return self.data['messages'][mid]
 
     def _get_subject(self, mid):
-        s = self._get_message(mid)['Subject']
-        return s.replace(os.linesep, '')
+        return self._get_message(mid).subject
 
-    def parse(self, percentage=True):
-        mbox_txt = os.path.splitext(self.mbox)[0]
-        with gzip.open(self.mbox, 'rb') as gz:
-            with open(mbox_txt, 'wb') as txt:
-                shutil.copyfileobj(gz, txt)
+    def _get_date(self, msg):
+        # The date is UTC, a message without a valid date is dated the
+        # first of the archive's month
         try:
-            mbox = mailbox.mbox(mbox_txt, create=False)
-            msgs = len(mbox)
-            count = 0
-            for msg in mbox.values():
-                if count % 64 == 0 and percentage:
-                    percent = round((float(count) / msgs) * 100, 2)
-                    _print_percentage('Parsing', percent, self.archive)
-                e = email.message_from_string(str(msg))
-                mid = e['Message-ID']
-                if mid in self.data['messages']:
-                    continue
-                self.data['messages'][mid] = e
-                mfrom = e['From']
-                msubject = self._get_subject(mid)
-                self._add_mid(self.data['from'], mfrom, mid)
-                if msubject.startswith('Build '):
-                    self.data['builds'] += [mid]
-                elif msubject.startswith('[rtems-test] '):
-                    self.data['tests'] += [mid]
-                elif msubject.startswith('[rtems-bsp-builder] '):
-                    self.data['bsp-builds'] += [mid]
+            dt = email.utils.parsedate_to_datetime(msg.date)
+            if dt.tzinfo is not None:
+                dt = dt.astimezone(datetime.timezone.utc)
+            return dt.strftime('%Y-%m-%d %H:%M:%S')
+        except (TypeError, ValueError):
+            return '%04d-%02d-01 00:00:00' % (self.year, self.month)
+
+    def _parse(self, reader, raw, size, percentage, offset=0, seen=None):
+        # The bodies of the test and BSP builder reports are scanned for
+        # their counts as the archive is read. Only the counts are held.
+        scanned = [None]
+
+        def _body(headers):
+            subject = headers['Subject']
+            if subject is None:
+                subject = ''
+            names = self.body_counts.get(
+                parse_subject(subject.replace(os.linesep, '')).kind)
+            if names is None:
+                return None
+            scanned[0] = {}
+            return count_scanner(names, scanned[0])
+
+        if seen is None:
+            seen = set()
+        count = 0
+        parsed = self.parsed
+        reader = _crc_reader(reader, parsed['crc32'])
+        for offset, length, headers in mbox_messages(reader, self.headers,
+                                                     offset, _body):
+            counts = scanned[0]
+            scanned[0] = None
+            if count % 64 == 0 and percentage:
+                percent = round((float(raw.tell()) / size) * 100, 2)
+                _print_percentage('Parsing', percent, self.archive)
+            parsed['offset'] = offset + length
+            parsed['last-offset'] = offset
+            parsed['last-mid'] = headers['Message-ID']
+            mid = headers['Message-ID']
+            if mid in self.data['messages'] or mid in seen:
+                continue
+            msg = message(mid, headers['From'], headers['Subject'],
+                          headers['Date'], offset, length)
+            self.data['messages'][mid] = msg
+            self._add_mid(self.data['from'], msg.mfrom, mid)
+            self.data[self.buckets[parse_subject(msg.subject).kind]] += [mid]
+            if counts is not None:
+                self.data['counts'][mid] = counts
+            count += 1
+        parsed['crc32'] = reader.crc
+
+    def parse(self, percentage=True):
+        size = os.path.getsize(self.mbox)
+        self.parsed = {
+            'offset': 0,
+            'last-offset': 0,
+            'last-mid': None,
+            'crc32': 0,
+            'mids': []
+        }
+        with open(self.mbox, 'rb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='rb') as gz:
+                if self.index is None or self.index.valid():
+                    self._parse(gz, raw, size, percentage)
                 else:
-                    self.data['unknown'] += [mid]
-                count += 1
-            if percentage:
-                _print_percentage('Parsing', 100, self.archive)
-                print()
-        finally:
-            if os.path.exists(mbox_txt):
-                os.remove(mbox_txt)
+                    # Write the decompressed copy as the archive is parsed
+                    with self.index.writer() as copy:
+                        self._parse(_tee(gz, copy), raw, size, percentage)
+                    self.index.save(self.data['messages'])
+        if percentage:
+            _print_done('Parsing', self.archive)
+
+    def resume(self, checkpoint, percentage=True):
+        """Parse the messages after the checkpoint. The archive has to start
+        with the checkpointed data and the last checkpointed message has
+        to be followed by a new message or the end of the archive. Return
+        False and parse nothing if the archive does not match. The new
+        messages are appended to the message index's copy if there is an
+        index and the copy has to hold the checkpointed data."""
+        size = os.path.getsize(self.mbox)
+        with open(self.mbox, 'rb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='rb') as gz:
+                crc = 0
+                remaining = checkpoint['last-offset']
+                while remaining > 0:
+                    data = gz.read(min(remaining, 1024 * 1024))
+                    if len(data) == 0:
+                        return False
+                    crc = zlib.crc32(data, crc)
+                    remaining -= len(data)
+                last = gz.read(checkpoint['offset'] -
+                               checkpoint['last-offset'])
+                crc = zlib.crc32(last, crc)
+                if crc != checkpoint['crc32']:
+                    return False
+                mids = [
+                    headers['Message-ID'] for offset, length, headers in
+                    mbox_messages(last.splitlines(keepends=True),
+                                  ['Message-ID'])
+                ]
+                if mids != [checkpoint['last-mid']]:
+                    return False
+                line = gz.readline()
+                if len(line) != 0 and not line.startswith(b'From '):
+                    return False
+                copy = None
+                if self.index is not None:
+                    copy = self.index.appender(checkpoint['offset'],
+                                               checkpoint['crc32'])
+                    if copy is None:
+                        return False
+                self.parsed = dict(checkpoint)
+                reader = itertools.chain([line], gz)
+                if copy is None:
+                    self._parse(reader, raw, size, percentage,
+                                checkpoint['offset'], set(checkpoint['mids']))
+                else:
+                    with copy:
+                        self._parse(_tee(reader, copy), raw, size, percentage,
+                                    checkpoint['offset'],
+                                    set(checkpoint['mids']))
+                    self.index.save(self.data['messages'])
+        if percentage:
+            _print_done('Parsing', self.archive)
+        return True
+
+    def checkpoint(self):
+        """Return the checkpoint of the parsed messages. The checkpoint is
+        the decompressed offset of the end of the last message, the number
+        of messages, the last message's Message-ID and offset, the CRC-32
+        of the decompressed data up to the end of the last message and
+        the Message-IDs of the messages."""
+        cp = dict(self.parsed)
+        cp['mids'] = cp['mids'] + list(self.data['messages'].keys())
+        cp['messages'] = len(cp['mids'])
+        return cp
+
+    def body(self, mid):
+        """Read a message from the archive and return it as an email
+        message. The message index is used if there is one else the
+        archive is decompressed up to the message."""
+        raw = None
+        if self.index is not None:
+            raw = self.index.message(mid)
+        if raw is None:
+            msg = self._get_message(mid)
+            with gzip.open(self.mbox, 'rb') as gz:
+                gz.seek(msg.offset)
+                raw = gz.read(msg.length)
+        # Remove the mbox From line
+        raw = raw.split(b'\n', 1)[1]
+        return email.message_from_bytes(raw)
+
+    def tests_results(self):
+        """Return the runs of the month's [rtems-test] reports as the
+        Message-ID digest, the BSP and the passed, failed and timeout counts
+        of each report. The counts are taken from the report's summary in
+        the body and from the subject if the body has no summary. The
+        bodies are scanned when the archive is parsed."""
+        runs = []
+        for mid in self.data['tests']:
+            msg = self._get_message(mid)
+            m = re_test_subject.match(msg.subject)
+            if m is None:
+                continue
+            counts = dict(self.data['counts'].get(mid, {}))
+            if len(counts) == 0:
+                for c in re_subject_count.finditer(msg.subject[m.end():]):
+                    name = c.group('name').strip().lower()
+                    if name in test_counts:
+                        counts[test_counts[name]] = int(c.group('count'))
+            runs += [[message_id_digest(mid), m.group('bsp'), counts]]
+        return runs
+
+    def bsp_build_results(self):
+        """Return the runs of the month's [rtems-bsp-builder] reports as the
+        Message-ID digest, the target and the passes and failures counts of
+        each report. The counts are taken from the report's summary in the
+        body and from the subject's result if the body has no summary. The
+        bodies are scanned when the archive is parsed."""
+        runs = []
+        for mid in self.data['bsp-builds']:
+            msg = self._get_message(mid)
+            m = re_bsp_build_subject.match(msg.subject)
+            if m is None:
+                continue
+            counts = dict(self.data['counts'].get(mid, {}))
+            if len(counts) == 0:
+                if m.group('result').upper().startswith('PASS'):
+                    counts['passes'] = 1
+                else:
+                    counts['failures'] = 1
+            runs += [[message_id_digest(mid), m.group('target'), counts]]
+        return runs
 
     def build_results(self):
+        """Return the month's build results. Build subjects that are not
+        valid are collected in the invalid list and do not stop the
+        results being created."""
         fails = []
         passes = []
+        self.data['invalid'] = []
         for mid in self.data['builds']:
             msg = self._get_message(mid)
-            s = self._get_subject(mid)
-            ss = s.split(':')
-            if len(ss) != 2:
-                raise Exception('invalid build subject: ' + s)
-            srs = ss[1].split()
-            if len(srs) < 4:
-                raise Exception('invalid build subject: ' + s)
+            subject = parse_subject(msg.subject)
+            if subject.kind != 'build':
+                self.data['invalid'] += [mid]
+                continue
             rec = {
-                'result': srs[0].strip(),
-                'host': ss[0][len('Build '):].strip(),
-                'os': srs[3].strip(),
-                'buildset': srs[1].strip()
+                'result': subject.result,
+                'host': subject.host,
+                'os': subject.os,
+                'buildset': subject.buildset,
+                'date': self._get_date(msg),
+                'mid': message_id_digest(mid)
             }
-            # Early logs do not have the host
-            if rec['host'] == '':
-                sss = ss[1].split()
-                if len(sss) != 4 or sss[2] != 'on':
-                    rec['host'] = 'unknown'
-                else:
-                    if 'linux' in sss[3]:
-                        rec['host'] = 'Linux'
-                    elif 'freebsd' in sss[3]:
-                        rec['host'] = 'FreeBSD'
-                    elif 'w64-mingw32' in sss[3]:
-                        rec['host'] = 'MINGW64_NT-10.0'
-                    elif 'darwin' in sss[3]:
-                        rec['host'] = 'Darwin'
-                    else:
-                        rec['host'] = 'unknown'
-            if rec['result'] == 'PASSED':
+            if subject.result == 'PASSED':
                 passes += [rec]
-            elif rec['result'] == 'FAILED':
-                fails += [rec]
             else:
-                raise Exception('invalid build result: ' + rec['results'])
+                fails += [rec]
         return month_results(self.year, self.month, passes, fails)
 
+    def has_invalid(self):
+        return len(self.data['invalid']) != 0
+
+    def list_invalid(self):
+        return [self._get_subject(mid) for mid in self.data['invalid']]
+
     def has_unknowns(self):
         return len(self.data['unknown']) != 0
 